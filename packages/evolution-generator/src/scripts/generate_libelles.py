@@ -4,15 +4,184 @@
 
 # Note: This script includes functions that generate the locales libelles files.
 # These functions are intended to be invoked from the generate_survey.py script.
+import csv  # For reading the exported Widgets sheet
+import io  # For dumping YAML in memory
 import os  # For interacting with the operating system
-from glob import glob, escape  # For file path matching
+import re  # For matching the text formatting notations
+import threading  # For per-thread YAML parsers
+from concurrent.futures import ThreadPoolExecutor  # For parallel file operations
+from collections import Counter, defaultdict  # For counting and grouping values
+from functools import lru_cache  # For memoizing replaced values
+import json  # For caching parsed YAML files
 import ruamel.yaml  # For working with YAML files
+import yaml as pyyaml  # For fast loading of YAML files
 import openpyxl  # For reading Excel files
 
-# Initialize YAML parser
-yaml = ruamel.yaml.YAML()
-yaml.indent(sequence=4, offset=4, mapping=4)
-yaml.width = 80
+# YAML dumpers keep their state on the instance, so each thread needs its own
+yamlThreadData = threading.local()
+
+
+# Get the YAML parser of the current thread
+def get_yaml():
+    if not hasattr(yamlThreadData, "yaml"):
+        # Initialize YAML parser
+        yaml = ruamel.yaml.YAML()
+        yaml.indent(sequence=4, offset=4, mapping=4)
+        yaml.width = 80
+        yamlThreadData.yaml = yaml
+    return yamlThreadData.yaml
+
+
+# Use the libyaml C loader when available, ruamel is only needed to dump files
+try:
+    from yaml import CSafeLoader
+except ImportError:
+    from yaml import SafeLoader as CSafeLoader
+
+
+# Use orjson to read and write the cache when available, it is much faster
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# YAML loader keeping every scalar as a string (e.g. 'No' is not a boolean)
+class TranslationLoader(CSafeLoader):
+    yaml_implicit_resolvers = {}
+
+
+# Define constants
+YAML_CACHE_FOLDER = ".cache"  # Hidden folder in the locales folder
+YAML_CACHE_FILE = "libelles_translations.json"
+WIDGETS_COLUMNS_COUNT = 7  # Columns used in the Widgets sheet, up to the en column
+WIDGETS_CSV_HEADERS = ["section", "path", "fr", "en"]  # Headers of columns D to G
+GENERATOR_COMMENT = (
+    "# This file was automatically generated by the Evolution Generator.\n"
+    "# The Evolution Generator is used to automate the creation of consistent, reliable code.\n"
+    "# Any changes made to this file will be overwritten.\n\n"
+)
+
+# Parsed YAML files, keyed by file path, with the mtime and size they were read at
+yamlCache = {}
+
+
+# Get the path of the parsed YAML files cache of a locales folder
+def get_yaml_cache_file(localesPath):
+    return os.path.join(localesPath, YAML_CACHE_FOLDER, YAML_CACHE_FILE)
+
+
+# Load the parsed YAML files cache from disk
+def load_yaml_cache(localesPath):
+    yamlCache.clear()
+    cacheFile = get_yaml_cache_file(localesPath)
+    if not os.path.isfile(cacheFile):
+        return
+    try:
+        with open(cacheFile, "rb") as file:
+            content = file.read()
+        cache = orjson.loads(content) if orjson else json.loads(content)
+        if not isinstance(cache, dict):
+            raise Exception("the cache is not a JSON object")
+        yamlCache.update(cache)
+    except Exception as e:
+        # An unreadable cache is simply rebuilt
+        print(f"Ignoring invalid YAML cache {cacheFile}: {e}")
+
+
+# Save the parsed YAML files cache to disk
+def save_yaml_cache(localesPath):
+    if not os.path.isdir(localesPath):
+        return
+    cacheFile = get_yaml_cache_file(localesPath)
+    try:
+        cacheFolder = os.path.dirname(cacheFile)
+        os.makedirs(cacheFolder, exist_ok=True)
+
+        # Keep the cache folder out of version control
+        gitignoreFile = os.path.join(cacheFolder, ".gitignore")
+        if not os.path.isfile(gitignoreFile):
+            with open(gitignoreFile, "w", encoding="utf-8") as file:
+                file.write("*\n")
+
+        # Forget the files that were deleted since they were cached
+        cache = {
+            path: entry for path, entry in yamlCache.items() if os.path.isfile(path)
+        }
+        if orjson:
+            content = orjson.dumps(cache, option=orjson.OPT_APPEND_NEWLINE)
+        else:
+            content = json.dumps(cache, ensure_ascii=False).encode("utf-8") + b"\n"
+        with open(cacheFile, "wb") as file:
+            file.write(content)
+    except Exception as e:
+        # The cache is only an optimization, the locales files are already saved
+        print(f"Ignoring YAML cache {cacheFile} that could not be saved: {e}")
+
+
+# Pad a Widgets sheet row with None, so all the used columns can be indexed
+def pad_widgets_row(row):
+    if len(row) >= WIDGETS_COLUMNS_COUNT:
+        return row
+    return tuple(row) + (None,) * (WIDGETS_COLUMNS_COUNT - len(row))
+
+
+# Read the rows values of a Widgets sheet CSV export, skipping the headers
+def load_widgets_csv_rows(csvFile):
+    with open(csvFile, mode="r", encoding="utf-8-sig", newline="") as file:
+        # Excel exports CSV with ';' separators in some locales, like French
+        headersLine = file.readline()
+        try:
+            dialect = csv.Sniffer().sniff(headersLine, delimiters=",;\t")
+        except csv.Error:
+            dialect = csv.excel
+        file.seek(0)
+
+        reader = csv.reader(file, dialect)
+        headers = next(reader, [])
+        if headers[3:WIDGETS_COLUMNS_COUNT] != WIDGETS_CSV_HEADERS:
+            raise Exception(
+                f"Invalid headers in {csvFile}: columns D to G must be "
+                + ", ".join(WIDGETS_CSV_HEADERS)
+            )
+
+        rows = []
+        for row in reader:
+            # Skip blank lines
+            if not row:
+                continue
+            if len(row) < WIDGETS_COLUMNS_COUNT:
+                raise Exception(
+                    f"Invalid number of columns at line {reader.line_num} in {csvFile}"
+                )
+            # Empty cells are None, like in Excel
+            rows.append(tuple(value if value != "" else None for value in row))
+        return rows
+
+
+# Read the Widgets sheet rows values, skipping the headers. A CSV export of the
+# sheet named <inputFile>.widgets.csv is used instead when newer than the Excel
+def load_widgets_rows(inputFile):
+    csvFile = os.path.splitext(inputFile)[0] + ".widgets.csv"
+    csvIsUpToDate = os.path.isfile(csvFile) and (
+        os.path.getmtime(csvFile) >= os.path.getmtime(inputFile)
+    )
+    if csvIsUpToDate:
+        return load_widgets_csv_rows(csvFile)
+
+    # Read-only mode streams the sheet instead of loading it all in memory
+    workbook = openpyxl.load_workbook(inputFile, data_only=True, read_only=True)
+    try:
+        sheet = workbook["Widgets"]  # Get Widgets sheet
+        # Read-only mode trusts the sheet dimension, which may be missing or wrong
+        sheet.reset_dimensions()
+        rows = [
+            pad_widgets_row(row) for row in sheet.iter_rows(min_row=2, values_only=True)
+        ]
+    finally:
+        # Read-only workbooks keep the file open until closed
+        workbook.close()
+    return rows
 
 
 # Class for handling various text formatting notations
@@ -34,50 +203,50 @@ class ValueReplacer:
     endRed = "</span>"
     redNotation = "_red_"
 
-    # Static methods for replacing notations with proper HTML tags
-    @staticmethod
-    def replaceStartEnd(string, notation, startReplaced, endReplaced):
-        # Replaces notations with corresponding start/end tags in the string
-        replacedStr = string
-        if notation in replacedStr and replacedStr.count(notation) % 2 == 0:
-            replacedCount = 0
-            while notation in replacedStr:
-                replaceWith = startReplaced if replacedCount % 2 == 0 else endReplaced
-                replacedStr = replacedStr.replace(notation, replaceWith, 1)
-                replacedCount += 1
-        return replacedStr
-
-    # Main replace function applying all notations
+    # Start and end tags for each notation
+    notationTags = {
+        boldNotation: (startBoldHtml, endBoldHtml),
+        obliqueNotation: (startOblique, endOblique),
+        greenNotation: (startGreen, endGreen),
+        redNotation: (startRed, endRed),
+    }
+
+    # Regex matching any of the notations, to replace them all in a single pass.
+    # Notations are matched from left to right and the characters of a matched
+    # notation can not be part of another one, so in '_green__red_' the '__'
+    # is not an oblique notation.
+    notationRegex = re.compile(
+        "|".join(re.escape(notation) for notation in notationTags)
+    )
+
+    # Main replace function applying all notations, memoized as the same
+    # values are often repeated across paths and languages
     @staticmethod
+    @lru_cache(maxsize=8192)
     def replace(string):
         # Replaces newlines with <br> tags and applies other notations
         replacedStr = string.replace("\n", "<br />")
-        # replaced each bold, oblique, green and red notations by proper tags
-        replacedStr = ValueReplacer.replaceStartEnd(
-            replacedStr,
-            ValueReplacer.boldNotation,
-            ValueReplacer.startBoldHtml,
-            ValueReplacer.endBoldHtml,
-        )
-        replacedStr = ValueReplacer.replaceStartEnd(
-            replacedStr,
-            ValueReplacer.obliqueNotation,
-            ValueReplacer.startOblique,
-            ValueReplacer.endOblique,
-        )
-        replacedStr = ValueReplacer.replaceStartEnd(
-            replacedStr,
-            ValueReplacer.greenNotation,
-            ValueReplacer.startGreen,
-            ValueReplacer.endGreen,
-        )
-        replacedStr = ValueReplacer.replaceStartEnd(
-            replacedStr,
-            ValueReplacer.redNotation,
-            ValueReplacer.startRed,
-            ValueReplacer.endRed,
-        )
-        return replacedStr
+        notations = ValueReplacer.notationRegex.findall(replacedStr)
+        if not notations:
+            return replacedStr
+
+        # Only replace notations with an even count, others are left untouched
+        notationCounts = Counter(notations)
+        replacedCounts = {
+            notation: 0 for notation, count in notationCounts.items() if count % 2 == 0
+        }
+
+        # Replace each bold, oblique, green and red notations by proper tags
+        def replaceNotation(match):
+            notation = match.group(0)
+            if notation not in replacedCounts:
+                return notation
+            startReplaced, endReplaced = ValueReplacer.notationTags[notation]
+            replacedCount = replacedCounts[notation]
+            replacedCounts[notation] = replacedCount + 1
+            return startReplaced if replacedCount % 2 == 0 else endReplaced
+
+        return ValueReplacer.notationRegex.sub(replaceNotation, replacedStr)
 
 
 # Class for managing translations in a specific language and section
@@ -85,43 +254,77 @@ class TranslationLangNs:
     def __init__(self, inputFile):
         self.modified = False
         self.data = {}
+        self.loadedData = None  # Data loaded from the file, kept unchanged
         self.file = inputFile
         self.startBoldHtml = "<strong>"
         self.endBoldHtml = "</strong>"
 
     # Convert string to YAML format
     def stringToYaml(self, str):
-        if "\n" in str:
-            return ruamel.yaml.scalarstring.FoldedScalarString(str)
-        if len(str) > 76:
+        if len(str) > 76 or "\n" in str:
             return ruamel.yaml.scalarstring.FoldedScalarString(str)
         return str
 
     # Load existing translations from the YAML file
     def loadCurrentTranslations(self):
-        with open(self.file, mode="r") as stream:
-            try:
-                translationData = yaml.load(stream)
-                self.data = {}
-                for path in translationData:
-                    self.data[path] = self.stringToYaml(translationData[path])
-            except Exception as err:
-                print(f"Error loading yaml file {err}")
-                raise Exception("Error loading translation yaml file " + self.file)
-
-    # Save modifications back to the YAML file
+        stat = os.stat(self.file)
+
+        # Reuse the parsed data when the file is unchanged since the last run
+        # Invalid cache entries are ignored and the file is parsed again
+        cached = yamlCache.get(self.file)
+        if (
+            isinstance(cached, dict)
+            and cached.get("mtime_ns") == stat.st_mtime_ns
+            and cached.get("size") == stat.st_size
+            and isinstance(cached.get("data"), dict)
+        ):
+            translationData = cached["data"]
+        else:
+            with open(self.file, mode="r") as stream:
+                try:
+                    translationData = pyyaml.load(stream, Loader=TranslationLoader)
+                except Exception as err:
+                    print(f"Error loading yaml file {err}")
+                    raise Exception("Error loading translation yaml file " + self.file)
+            yamlCache[self.file] = {
+                "mtime_ns": stat.st_mtime_ns,
+                "size": stat.st_size,
+                "data": translationData,
+            }
+
+        # Keep the parsed values as is, they are only converted when dumped
+        try:
+            self.data = dict(translationData)
+            self.loadedData = translationData
+        except Exception as err:
+            print(f"Error loading yaml file {err}")
+            raise Exception("Error loading translation yaml file " + self.file)
+
+    # Save modifications back to the YAML file, returns whether it was written
     def save(self):
         if self.modified:
-            with open(self.file, "w", encoding="utf-8") as file:
-                file.write(
-                    "# This file was automatically generated by the Evolution Generator.\n"
-                )
-                file.write(
-                    "# The Evolution Generator is used to automate the creation of consistent, reliable code.\n"
-                )
-                file.write("# Any changes made to this file will be overwritten.\n\n")
-                yaml.dump(self.data, file)
-            print(f"Generate {self.file.replace('\\', '/')} successfully")
+            # Skip the dump when the translations are the same as loaded
+            if self.loadedData is not None and self.data == self.loadedData:
+                return False
+
+            buffer = io.StringIO()
+            buffer.write(GENERATOR_COMMENT)
+            get_yaml().dump(
+                {path: self.stringToYaml(value) for path, value in self.data.items()},
+                buffer,
+            )
+            content = buffer.getvalue()
+
+            # Do not rewrite the file when its content is identical
+            if os.path.isfile(self.file):
+                with open(self.file, "r", encoding="utf-8") as file:
+                    if file.read() == content:
+                        return False
+
+            with open(self.file, "w", encoding="utf-8", buffering=65536) as file:
+                file.write(content)
+            return True
+        return False
 
     # Add a new translation or update an existing one
     def addTranslation(self, path, value, overwrite, keepMarkdown):
@@ -134,43 +337,67 @@ class TranslationLangNs:
         if not keepMarkdown:
             value = ValueReplacer.replace(value)
 
-        self.data[path] = self.stringToYaml(value)
+        # Do not flag the file as modified when the value is unchanged
+        if path in self.data and self.data[path] == value:
+            return
+
+        self.data[path] = value
         self.modified = True
 
 
 # Class for managing translations for all languages and sections
 class TranslationData:
     def __init__(self, localesPath):
-        self.translations = {}  # Dictionary to store translations
+        self.translations = defaultdict(dict)  # Dictionary to store translations
         self.localesPath = localesPath  # Path to the locales directory
+        # Template of the translations files paths, with braces of the path escaped
+        self.pathFormat = os.path.join(
+            localesPath.replace("{", "{{").replace("}", "}}"), "{lang}", "{section}.yml"
+        )
 
     # Add translations for a specific language and section
     def addTranslations(self, lang, section, translations):
-        if not lang in self.translations:
-            self.translations[lang] = {}
         self.translations[lang][section] = translations
 
     # Save all translations to their respective files
     def save(self):
-        for lang in self.translations:
-            for section in self.translations[lang]:
-                self.translations[lang][section].save()
+        modifiedTranslations = [
+            self.translations[lang][section]
+            for lang in self.translations
+            for section in self.translations[lang]
+            if self.translations[lang][section].modified
+        ]
+        if not modifiedTranslations:
+            return
+
+        # Files are independent, so dump and write them concurrently
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            savedFiles = list(
+                executor.map(TranslationLangNs.save, modifiedTranslations)
+            )
+
+        # Print from the main thread to keep the output in order
+        for translationNs, saved in zip(modifiedTranslations, savedFiles):
+            if saved:
+                print(f"Generate {translationNs.file.replace('\\', '/')} successfully")
+
+    # Get the translations of a language and section, created when missing
+    def getTranslationLangNs(self, lang, section):
+        translationNs = self.translations[lang].get(section)
+        if translationNs is None:
+            if section is None:
+                raise Exception(f"Missing section for {lang} translations")
+            translationNs = TranslationLangNs(
+                self.pathFormat.format(lang=lang, section=section)
+            )
+            self.translations[lang][section] = translationNs
+        return translationNs
 
     # Add a new translation to the specified language, section, and path
     def addTranslation(self, lang, section, path, value, overwrite, keepMarkdown):
-        try:
-            if not lang in self.translations:
-                self.translations[lang] = {}
-            if not section in self.translations[lang]:
-                self.translations[lang][section] = TranslationLangNs(
-                    os.path.join(self.localesPath, lang, section + ".yml")
-                )
-            self.translations[lang][section].addTranslation(
-                path, value, overwrite, keepMarkdown
-            )
-        except Exception as e:
-            print(f"Exception occurred for {lang} {section} {path}: {e}")
-            raise e
+        self.getTranslationLangNs(lang, section).addTranslation(
+            path, value, overwrite, keepMarkdown
+        )
 
 
 # Class for managing the overall translation process
@@ -181,19 +408,46 @@ class FillLocalesTranslations:
         self.overwrite = overwrite
         self.section = section
         self.allTranslations = TranslationData(localesPath)
+        self.existingPaths = set()  # (lang, section, path) loaded from YAML files
         super().__init__()
 
     # Load existing translations from YAML files
     def loadCurrentTranslations(self):
-        ymlFiles = glob(escape(self.localesPath) + "/**/*.yml")
-        for translationFile in ymlFiles:
-            path = os.path.normpath(os.path.dirname(translationFile))
-            paths = path.split(os.sep)
-            lang = paths[len(paths) - 1]
-            section = os.path.splitext(os.path.basename(translationFile))[0]
-            translationNs = TranslationLangNs(translationFile)
-            translationNs.loadCurrentTranslations()
+        if not os.path.isdir(self.localesPath):
+            return
+
+        # Files are in the <localesPath>/<lang>/<section>.yml structure
+        translationFiles = []
+        for langEntry in os.scandir(self.localesPath):
+            if langEntry.name.startswith(".") or not langEntry.is_dir():
+                continue
+            lang = langEntry.name
+            for fileEntry in os.scandir(langEntry.path):
+                fileName = fileEntry.name
+                if fileName.startswith(".") or not fileName.endswith(".yml"):
+                    continue
+                section = fileName[: -len(".yml")]
+                translationFiles.append(
+                    (lang, section, TranslationLangNs(fileEntry.path))
+                )
+
+        if not translationFiles:
+            return
+
+        # Files are independent, so load them concurrently
+        with ThreadPoolExecutor(max_workers=min(16, len(translationFiles))) as executor:
+            list(
+                executor.map(
+                    TranslationLangNs.loadCurrentTranslations,
+                    [translationNs for _, _, translationNs in translationFiles],
+                )
+            )
+
+        for lang, section, translationNs in translationFiles:
             self.allTranslations.addTranslations(lang, section, translationNs)
+            self.existingPaths.update(
+                (lang, section, path) for path in translationNs.data
+            )
 
     # Save all translations back to YAML files
     def saveAllTranslations(self):
@@ -201,28 +455,47 @@ class FillLocalesTranslations:
 
     # Function to add translations from Excel input file to the translations data
     def addTranslationsFromExcel(self):
+        # Translation being processed, to report where an error occurred
+        rowNumber = lang = section = path = None
         try:
-            workbook = openpyxl.load_workbook(self.inputFile, data_only=True)
-            sheet = workbook["Widgets"]  # Get Widgets sheet
+            rows = load_widgets_rows(self.inputFile)
+
+            # keepMarkdown = row[11]
+            keepMarkdown = False
 
-            for row in sheet.iter_rows(min_row=2, values_only=True):
+            # Group the (rowNumber, path, value) translations by language and
+            # section, keeping rows order
+            groupedTranslations = defaultdict(list)
+            for rowIndex, row in enumerate(rows, start=2):
                 section = row[3]
                 path = row[4]
                 fr = row[5]
                 en = row[6]
-                # keepMarkdown = row[11]
-                keepMarkdown = False
 
-                if fr is not None:
-                    self.allTranslations.addTranslation(
-                        "fr", section, path, fr, self.overwrite, keepMarkdown
-                    )
-                if en is not None:
-                    self.allTranslations.addTranslation(
-                        "en", section, path, en, self.overwrite, keepMarkdown
+                # Existing translations are kept unless overwriting
+                if fr is not None and (
+                    self.overwrite or ("fr", section, path) not in self.existingPaths
+                ):
+                    groupedTranslations[("fr", section)].append((rowIndex, path, fr))
+                if en is not None and (
+                    self.overwrite or ("en", section, path) not in self.existingPaths
+                ):
+                    groupedTranslations[("en", section)].append((rowIndex, path, en))
+
+            for (lang, section), translations in groupedTranslations.items():
+                # Report the first row if the section translations can not be created
+                rowNumber, path, _ = translations[0]
+                translationNs = self.allTranslations.getTranslationLangNs(lang, section)
+                for rowNumber, path, value in translations:
+                    translationNs.addTranslation(
+                        path, value, self.overwrite, keepMarkdown
                     )
 
         except Exception as e:
+            if rowNumber is not None:
+                print(
+                    f"Exception occurred at row {rowNumber} for {lang} {section} {path}: {e}"
+                )
             print(f"Exception occurred in addTranslationsFromExcel: {e}")
             raise e
 
@@ -232,9 +505,11 @@ def generate_libelles(inputFile, localesPath, overwrite=False, section=None):
     try:
         # Initialize the FillLocalesTranslations task with provided parameters
         task = FillLocalesTranslations(inputFile, localesPath, overwrite, section)
+        load_yaml_cache(localesPath)
         task.loadCurrentTranslations()
         task.addTranslationsFromExcel()
         task.saveAllTranslations()
+        save_yaml_cache(localesPath)
         print("Generate translations successfully")
     except Exception as e:
         print(f"An error occurred: {e}")
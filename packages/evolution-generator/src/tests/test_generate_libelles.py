@@ -0,0 +1,415 @@
+# Copyright 2024, Polytechnique Montreal and contributors
+# This file is licensed under the MIT License.
+# License text available at https://opensource.org/licenses/MIT
+
+# Note: This script tests the generate_libelles functions.
+import json  # Read and write mocked YAML caches
+import os  # File system operations
+import pytest  # Testing framework
+import openpyxl  # Write mocked Excel data
+
+import scripts.generate_libelles as generate_libelles_module
+from scripts.generate_libelles import (
+    FillLocalesTranslations,
+    TranslationLangNs,
+    ValueReplacer,
+    get_yaml_cache_file,
+    load_widgets_rows,
+    load_yaml_cache,
+    save_yaml_cache,
+)
+
+# Define constants
+BOLD = ("<strong>", "</strong>")
+OBLIQUE = ('<span class="_pale _oblique">', "</span>")
+GREEN = ('<span style="color: green;">', "</span>")
+RED = ('<span style="color: red;">', "</span>")
+
+
+@pytest.mark.parametrize(
+    "value, expected_value",
+    [
+        # Test that a value without notations is unchanged
+        ("No notation", "No notation"),
+        # Test that newlines are replaced by br tags
+        ("First line\nSecond line", "First line<br />Second line"),
+        # Test each notation
+        ("Some **bold** text", f"Some {BOLD[0]}bold{BOLD[1]} text"),
+        ("Some __oblique__ text", f"Some {OBLIQUE[0]}oblique{OBLIQUE[1]} text"),
+        ("Some _green_green_green_ text", f"Some {GREEN[0]}green{GREEN[1]} text"),
+        ("Some _red_red_red_ text", f"Some {RED[0]}red{RED[1]} text"),
+        # Test that each pair of a notation is replaced
+        (
+            "**one** and **two**",
+            f"{BOLD[0]}one{BOLD[1]} and {BOLD[0]}two{BOLD[1]}",
+        ),
+        # Test that a notation with an odd count is left untouched
+        ("**one** and ** two", "**one** and ** two"),
+        # Test that only the notations with an odd count are left untouched
+        ("**one** and __two", f"{BOLD[0]}one{BOLD[1]} and __two"),
+        # Test mixed notations
+        (
+            "**bold** __oblique__ _green_green_green_ _red_red_red_\nend",
+            f"{BOLD[0]}bold{BOLD[1]} {OBLIQUE[0]}oblique{OBLIQUE[1]} "
+            f"{GREEN[0]}green{GREEN[1]} {RED[0]}red{RED[1]}<br />end",
+        ),
+        # Test nested notations
+        (
+            "**bold _red_and red_red_**",
+            f"{BOLD[0]}bold {RED[0]}and red{RED[1]}{BOLD[1]}",
+        ),
+        # Test adjacent notations: the leftmost notation is matched first and
+        # its characters can not be part of another notation
+        (
+            "_green__red_x_red__green_",
+            f"{GREEN[0]}{RED[0]}x{RED[1]}{GREEN[1]}",
+        ),
+        ("____", f"{OBLIQUE[0]}{OBLIQUE[1]}"),
+        ("a___red_\na_red__", f"a__{RED[0]}<br />a{RED[1]}_"),
+        (
+            "_red_word_green_word_green__green__red_",
+            f"{RED[0]}word_green_word_green__green_{RED[1]}",
+        ),
+    ],
+)
+def test_value_replacer_replace(value: str, expected_value: str) -> None:
+    # Check that the notations are replaced by the proper tags
+    assert ValueReplacer.replace(value) == expected_value
+
+
+@pytest.mark.parametrize(
+    "overwrite, keep_markdown, expected_value",
+    [
+        # Test that [nom] and the notations are replaced
+        (True, False, "Hi <strong>{{nickname}}</strong>"),
+        # Test that the markdown is kept when asked to
+        (True, True, "Hi **{{nickname}}**"),
+        # Test that the existing translation is kept when not overwriting
+        (False, False, "Existing"),
+    ],
+)
+def test_translation_lang_ns_add_translation(
+    overwrite: bool, keep_markdown: bool, expected_value: str
+) -> None:
+    translation_ns = TranslationLangNs("fr/home.yml")
+    translation_ns.data = {"question": "Existing"}
+
+    translation_ns.addTranslation("question", "Hi **[nom]**", overwrite, keep_markdown)
+
+    # Check the translation and whether the file must be saved
+    assert translation_ns.data["question"] == expected_value
+    assert translation_ns.modified == overwrite
+
+
+# Create an Excel file with a Widgets sheet, and its CSV export if given
+def create_widgets_files(tmp_path, excel_rows, csv_content=None):
+    input_file = os.path.join(tmp_path, "survey.xlsx")
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.title = "Widgets"
+    for row in excel_rows:
+        sheet.append(row)
+    workbook.save(input_file)
+
+    if csv_content is not None:
+        csv_file = os.path.join(tmp_path, "survey.widgets.csv")
+        with open(csv_file, mode="wb") as file:
+            file.write(csv_content.encode("utf-8"))
+        # Make sure the CSV export is newer than the Excel file
+        excel_mtime = os.path.getmtime(input_file)
+        os.utime(csv_file, (excel_mtime + 10, excel_mtime + 10))
+
+    return input_file
+
+
+def test_load_widgets_rows_from_csv(tmp_path) -> None:
+    input_file = create_widgets_files(
+        tmp_path,
+        [["a", "b", "c", "section", "path", "fr", "en"]],
+        # BOM, headers, empty cells, multiline value and blank lines
+        "\ufeffa,b,c,section,path,fr,en\r\n"
+        ",,,home,q1,Bonjour,Hello\r\n"
+        "\r\n"
+        ',,,home,q2,"Deux\nlignes",\r\n'
+        "\r\n",
+    )
+
+    assert load_widgets_rows(input_file) == [
+        (None, None, None, "home", "q1", "Bonjour", "Hello"),
+        (None, None, None, "home", "q2", "Deux\nlignes", None),
+    ]
+
+
+def test_load_widgets_rows_from_csv_with_semicolons(tmp_path) -> None:
+    # Excel exports CSV with ';' separators in the French locale
+    input_file = create_widgets_files(
+        tmp_path,
+        [["a", "b", "c", "section", "path", "fr", "en"]],
+        "\ufeffa;b;c;section;path;fr;en\r\n" ";;;home;q1;Bonjour, toi;Hello\r\n",
+    )
+
+    assert load_widgets_rows(input_file) == [
+        (None, None, None, "home", "q1", "Bonjour, toi", "Hello"),
+    ]
+
+
+@pytest.mark.parametrize(
+    "csv_content, expected_message",
+    [
+        # Test that the headers of columns D to G are checked
+        (
+            "a,b,c,path,section,fr,en\n,,,home,q1,Bonjour,Hello\n",
+            "Invalid headers",
+        ),
+        # Test that a file not split in columns is refused
+        ("a|b|c|section|path|fr|en\n", "Invalid headers"),
+        # Test that rows missing columns are refused instead of padded
+        (
+            "a,b,c,section,path,fr,en\n,,,home,q1,Bonjour,Hello\n,,,home,q2,Seul\n",
+            "Invalid number of columns at line 3",
+        ),
+    ],
+)
+def test_load_widgets_rows_from_invalid_csv(
+    tmp_path, csv_content: str, expected_message: str
+) -> None:
+    input_file = create_widgets_files(
+        tmp_path, [["a", "b", "c", "section", "path", "fr", "en"]], csv_content
+    )
+
+    with pytest.raises(Exception, match=expected_message):
+        load_widgets_rows(input_file)
+
+
+def test_load_widgets_rows_from_excel_when_csv_is_outdated(tmp_path) -> None:
+    input_file = create_widgets_files(
+        tmp_path,
+        [
+            ["a", "b", "c", "section", "path", "fr", "en"],
+            [None, None, None, "home", "q1", "Bonjour", "Hello"],
+            [None, None, None, "home", "q2", "Seul"],
+        ],
+        "a,b,c,section,path,fr,en\n,,,home,q1,Vieux,Old\n",
+    )
+    # Make the CSV export older than the Excel file
+    csv_file = os.path.join(tmp_path, "survey.widgets.csv")
+    excel_mtime = os.path.getmtime(input_file)
+    os.utime(csv_file, (excel_mtime - 10, excel_mtime - 10))
+
+    assert load_widgets_rows(input_file) == [
+        (None, None, None, "home", "q1", "Bonjour", "Hello"),
+        (None, None, None, "home", "q2", "Seul", None),
+    ]
+
+
+def test_load_widgets_rows_from_excel_without_csv(tmp_path) -> None:
+    input_file = create_widgets_files(
+        tmp_path,
+        [
+            ["a", "b", "c", "section", "path", "fr", "en"],
+            [None, None, None, "home", "q1", "Bonjour", "Hello"],
+        ],
+    )
+
+    assert load_widgets_rows(input_file) == [
+        (None, None, None, "home", "q1", "Bonjour", "Hello"),
+    ]
+
+
+def test_add_translations_from_excel_reports_failing_row(
+    tmp_path, monkeypatch, capsys
+) -> None:
+    # The second row has a numeric fr value, which can not be a translation
+    rows = [
+        (None, None, None, "home", "q1", "Bonjour", "Hello"),
+        (None, None, None, "home", "q2", 42, None),
+    ]
+    monkeypatch.setattr(
+        generate_libelles_module, "load_widgets_rows", lambda input_file: rows
+    )
+    task = FillLocalesTranslations("survey.xlsx", str(tmp_path), False, None)
+
+    with pytest.raises(Exception):
+        task.addTranslationsFromExcel()
+
+    # Check that the Excel row, language, section and path are reported
+    assert "Exception occurred at row 3 for fr home q2" in capsys.readouterr().out
+
+
+# Create a locales file and return its path
+def create_locales_file(locales_path, lang, section, content):
+    os.makedirs(os.path.join(locales_path, lang), exist_ok=True)
+    locales_file = os.path.join(locales_path, lang, f"{section}.yml")
+    with open(locales_file, mode="w", encoding="utf-8") as file:
+        file.write(content)
+    return locales_file
+
+
+# Load a locales file like a generator run would, and return its data
+def load_translations_run(locales_path, locales_file):
+    load_yaml_cache(locales_path)
+    translation_ns = TranslationLangNs(locales_file)
+    translation_ns.loadCurrentTranslations()
+    save_yaml_cache(locales_path)
+    return translation_ns.data
+
+
+# Count the YAML files parsed by the generator
+@pytest.fixture
+def yaml_loads(monkeypatch):
+    loads = []
+    yaml_load = generate_libelles_module.pyyaml.load
+
+    def counting_load(stream, Loader):
+        loads.append(stream.name)
+        return yaml_load(stream, Loader=Loader)
+
+    monkeypatch.setattr(generate_libelles_module.pyyaml, "load", counting_load)
+    return loads
+
+
+def test_yaml_cache_is_reused_when_unchanged(tmp_path, yaml_loads) -> None:
+    locales_path = str(tmp_path)
+    locales_file = create_locales_file(locales_path, "fr", "home", "q1: Bonjour\n")
+
+    assert load_translations_run(locales_path, locales_file) == {"q1": "Bonjour"}
+    assert load_translations_run(locales_path, locales_file) == {"q1": "Bonjour"}
+
+    # Check that the file was only parsed by the first run
+    assert yaml_loads == [locales_file]
+
+
+@pytest.mark.parametrize(
+    "content, mtime_offset",
+    [
+        # Test that a different mtime is detected
+        ("q1: Salut!\n", 10),
+        # Test that a different size is detected, even with the same mtime
+        ("q1: Salut toi\n", 0),
+    ],
+)
+def test_yaml_cache_is_ignored_when_file_changed(
+    tmp_path, yaml_loads, content: str, mtime_offset: int
+) -> None:
+    locales_path = str(tmp_path)
+    locales_file = create_locales_file(locales_path, "fr", "home", "q1: Bonjour\n")
+    load_translations_run(locales_path, locales_file)
+    stat = os.stat(locales_file)
+
+    # Edit the file, keeping or changing its mtime
+    create_locales_file(locales_path, "fr", "home", content)
+    mtime_ns = stat.st_mtime_ns + mtime_offset * 1_000_000_000
+    os.utime(locales_file, ns=(mtime_ns, mtime_ns))
+
+    assert load_translations_run(locales_path, locales_file) == {"q1": content[4:-1]}
+    assert yaml_loads == [locales_file, locales_file]
+
+
+@pytest.mark.parametrize(
+    "cache_content",
+    [
+        # Test that a cache that is not valid JSON is ignored
+        lambda stat: "{not json",
+        # Test that a cache that is not a JSON object is ignored
+        lambda stat: "[]",
+        # Test that an entry that is not an object is ignored
+        lambda stat: json.dumps({"{file}": "entry"}),
+        # Test that an entry missing its mtime and size is ignored
+        lambda stat: json.dumps({"{file}": {"data": {"q1": "Cache"}}}),
+        # Test that an entry with data that is not an object is ignored
+        lambda stat: json.dumps(
+            {
+                "{file}": {
+                    "mtime_ns": stat.st_mtime_ns,
+                    "size": stat.st_size,
+                    "data": ["Cache"],
+                }
+            }
+        ),
+    ],
+)
+def test_yaml_cache_falls_back_to_parsing_when_invalid(
+    tmp_path, yaml_loads, cache_content
+) -> None:
+    locales_path = str(tmp_path)
+    locales_file = create_locales_file(locales_path, "fr", "home", "q1: Bonjour\n")
+    cache_file = get_yaml_cache_file(locales_path)
+    os.makedirs(os.path.dirname(cache_file))
+    with open(cache_file, mode="w", encoding="utf-8") as file:
+        content = cache_content(os.stat(locales_file))
+        file.write(content.replace("{file}", locales_file.replace("\\", "\\\\")))
+
+    assert load_translations_run(locales_path, locales_file) == {"q1": "Bonjour"}
+    assert yaml_loads == [locales_file]
+
+
+def test_yaml_cache_forgets_deleted_files(tmp_path) -> None:
+    locales_path = str(tmp_path)
+    home_file = create_locales_file(locales_path, "fr", "home", "q1: Bonjour\n")
+    end_file = create_locales_file(locales_path, "fr", "end", "q2: Merci\n")
+    load_translations_run(locales_path, home_file)
+    load_translations_run(locales_path, end_file)
+    with open(get_yaml_cache_file(locales_path), encoding="utf-8") as file:
+        assert set(json.load(file)) == {home_file, end_file}
+
+    # Check that the deleted file entry is removed when the cache is saved
+    os.remove(end_file)
+    load_yaml_cache(locales_path)
+    save_yaml_cache(locales_path)
+    with open(get_yaml_cache_file(locales_path), encoding="utf-8") as file:
+        assert set(json.load(file)) == {home_file}
+
+
+# Set an old mtime on a file, so a rewrite would change it, and return it
+def set_old_mtime(file_path):
+    mtime_ns = os.stat(file_path).st_mtime_ns - 10_000_000_000
+    os.utime(file_path, ns=(mtime_ns, mtime_ns))
+    return mtime_ns
+
+
+def test_translation_lang_ns_save_skips_values_set_back(tmp_path) -> None:
+    locales_file = create_locales_file(
+        str(tmp_path), "fr", "home", "q1: Bonjour\nq2: Merci\n"
+    )
+    mtime_ns = set_old_mtime(locales_file)
+    translation_ns = TranslationLangNs(locales_file)
+    translation_ns.loadCurrentTranslations()
+
+    # Change a value, then set it back to the loaded value
+    translation_ns.addTranslation("q1", "Salut", True, False)
+    translation_ns.addTranslation("q1", "Bonjour", True, False)
+
+    # Check that the file is not written
+    assert translation_ns.modified
+    assert translation_ns.save() is False
+    assert os.stat(locales_file).st_mtime_ns == mtime_ns
+
+
+@pytest.mark.parametrize(
+    "value, expected_saved",
+    [
+        # Test that the file is not rewritten when the dumped content is identical
+        ("Bonjour", False),
+        # Test that the file is written when the dumped content differs
+        ("Salut", True),
+    ],
+)
+def test_translation_lang_ns_save_skips_identical_content(
+    tmp_path, value: str, expected_saved: bool
+) -> None:
+    locales_file = os.path.join(tmp_path, "home.yml")
+    translation_ns = TranslationLangNs(locales_file)
+    translation_ns.addTranslation("q1", "Bonjour", True, False)
+    assert translation_ns.save() is True
+    with open(locales_file, "rb") as file:
+        saved_content = file.read()
+    mtime_ns = set_old_mtime(locales_file)
+
+    # Dump the translations again, without loading the file first
+    translation_ns = TranslationLangNs(locales_file)
+    translation_ns.addTranslation("q1", value, True, False)
+
+    assert translation_ns.save() is expected_saved
+    assert (os.stat(locales_file).st_mtime_ns != mtime_ns) == expected_saved
+    with open(locales_file, "rb") as file:
+        assert (file.read() != saved_content) == expected_saved